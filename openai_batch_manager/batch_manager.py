@@ -1,25 +1,35 @@
 # openai_batch_manager/batch_manager.py
 
 import asyncio
+import functools
 import httpx
 import json
+import os
+import random
 import time
-from typing import List, Optional, Dict
+from typing import AsyncIterator, BinaryIO, Optional, Dict, List, Tuple
 from openai_batch_manager.config import (
     API_KEY,
     COMPLETION_WINDOW,
     ENDPOINT,
 )
-from openai_batch_manager.utils import ensure_directory, clean_up_files
+from openai_batch_manager.state import BatchState, UPLOADED, SUBMITTED, DOWNLOADED
+from openai_batch_manager.utils import DirectFileWriter, ensure_directory
 import logging
 from tenacity import (
     retry,
     stop_after_attempt,
     wait_exponential,
-    retry_if_exception_type,
+    retry_if_exception,
 )
+from tenacity.wait import wait_base
 from tqdm.asyncio import tqdm_asyncio
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logger
 logger = logging.getLogger("BatchManager")
 logger.setLevel(logging.INFO)
@@ -35,79 +45,258 @@ fh = logging.FileHandler("batch_manager.log")
 fh.setFormatter(formatter)
 logger.addHandler(fh)
 
+# Size of the chunks streamed to disk when downloading results
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+# Terminal batch statuses ('completed' is what the OpenAI API reports)
+SUCCEEDED_STATUSES = {'completed', 'succeeded'}
+FAILED_STATUSES = {'failed', 'cancelled', 'expired'}
+
+# Name of the resumable state database kept in the output directory
+STATE_DB_NAME = "state.db"
+
+# Status polling backoff (seconds)
+POLL_INITIAL_DELAY = 5.0
+POLL_MAX_DELAY = 120.0
+POLL_BACKOFF_FACTOR = 1.5
+
+
+class BatchFailedError(RuntimeError):
+    """
+    Raised when a batch reaches a failed terminal status (failed, cancelled
+    or expired), which is kept in `status`.
+    """
+
+    def __init__(self, batch_id: str, status: str):
+        super().__init__(f"Batch {batch_id} ended with status: {status}")
+        self.batch_id = batch_id
+        self.status = status
+
+
+def _dumps(obj) -> bytes:
+    """
+    Serializes an object to compact JSON bytes, using orjson when available.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+# HTTP status codes worth retrying (timeouts, conflicts, rate limits, server errors)
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Upper bound on a server-requested Retry-After wait (seconds)
+RETRY_AFTER_MAX = POLL_MAX_DELAY
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """
+    Returns True for network errors and transient HTTP error responses.
+    """
+    if isinstance(exc, httpx.RequestError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+class _wait_retry_after(wait_base):
+    """
+    Waits for the server's Retry-After header when present (capped at
+    RETRY_AFTER_MAX), otherwise falls back to the given wait strategy.
+    """
+
+    def __init__(self, fallback: wait_base):
+        self.fallback = fallback
+
+    def __call__(self, retry_state) -> float:
+        exc = retry_state.outcome.exception()
+        if isinstance(exc, httpx.HTTPStatusError):
+            retry_after = exc.response.headers.get("retry-after")
+            if retry_after is not None:
+                try:
+                    return min(max(float(retry_after), 0.0), RETRY_AFTER_MAX)
+                except ValueError:
+                    pass  # HTTP-date form, use the fallback
+        return self.fallback(retry_state)
+
+
+def _build_client(api_key: str, max_connections: int) -> httpx.AsyncClient:
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,  # Connection-level retries only
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=120,
+        ),
+    )
+    return httpx.AsyncClient(
+        base_url="https://api.openai.com",
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=60.0,  # Adjust as needed
+        transport=transport,
+    )
+
+
+# (api_key, purpose, max_connections, event loop) -> [client, reference count]
+_shared_clients: Dict[Tuple[str, str, int, asyncio.AbstractEventLoop], list] = {}
+
+
+def get_shared_client(api_key: str, purpose: str = "api", max_connections: int = 12) -> httpx.AsyncClient:
+    """
+    Returns the client shared by all users of `api_key` for `purpose` with a
+    pool of `max_connections`, creating it if needed, so warm connections are
+    reused across BatchManager instances. Clients are bound to the running
+    event loop, so each loop gets its own. Every call must be paired with
+    release_shared_client() on the same loop.
+    """
+    loop = asyncio.get_running_loop()
+    # Forget clients left behind by loops that have since closed; their
+    # connections died with the loop
+    for stale in [key for key in _shared_clients if key[3].is_closed()]:
+        del _shared_clients[stale]
+    key = (api_key, purpose, max_connections, loop)
+    entry = _shared_clients.get(key)
+    if entry is None:
+        entry = _shared_clients[key] = [_build_client(api_key, max_connections), 0]
+    entry[1] += 1
+    return entry[0]
+
+
+async def release_shared_client(api_key: str, purpose: str = "api", max_connections: int = 12):
+    """
+    Drops a reference to a shared client and closes it when none remain.
+    """
+    key = (api_key, purpose, max_connections, asyncio.get_running_loop())
+    entry = _shared_clients.get(key)
+    if entry is None:
+        return
+    entry[1] -= 1
+    if entry[1] <= 0:
+        del _shared_clients[key]
+        await entry[0].aclose()
+
 
 class BatchManager:
-    def __init__(self, api_key: str, endpoint: str, completion_window: str, output_dir: str):
+    def __init__(
+        self,
+        api_key: str,
+        endpoint: str,
+        completion_window: str,
+        output_dir: str,
+        max_concurrency: int = 4,
+        resume: bool = False,
+    ):
         self.api_key = api_key
         self.endpoint = endpoint
         self.completion_window = completion_window
         self.output_dir = output_dir
-        self.client = httpx.AsyncClient(
-            base_url="https://api.openai.com",
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            },
-            timeout=60.0,  # Adjust as needed
-        )
+        # Number of workers per pipeline stage (upload, poll, download)
+        self.max_concurrency = max_concurrency
+        # Continue from the state recorded by a previous run instead of starting over
+        self.resume = resume
+        # The fixed part of every create-batch request, serialized once
+        self._create_payload_template = _dumps({
+            "completion_window": completion_window,
+            "endpoint": endpoint,
+        })
+        # Shared clients in use, by (purpose, event loop); see _shared_client()
+        self._clients: Dict[Tuple[str, asyncio.AbstractEventLoop], httpx.AsyncClient] = {}
+
+    def _pool_size(self, purpose: str) -> int:
+        # Every stage talks to the API at once, so size its pool for all of them
+        return self.max_concurrency * 3 if purpose == "api" else self.max_concurrency
+
+    def _shared_client(self, purpose: str) -> httpx.AsyncClient:
+        """
+        Returns this manager's client for `purpose` on the running event loop,
+        taking a reference to the shared one the first time it is needed.
+        """
+        key = (purpose, asyncio.get_running_loop())
+        client = self._clients.get(key)
+        if client is None:
+            client = self._clients[key] = get_shared_client(self.api_key, purpose, self._pool_size(purpose))
+        return client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # No default Content-Type: httpx sets it per request (JSON or multipart).
+        # Clients are shared between managers using the same API key.
+        return self._shared_client("api")
+
+    @property
+    def download_client(self) -> httpx.AsyncClient:
+        # Large result downloads get their own pool so they don't hold up polling
+        return self._shared_client("download")
 
     async def close(self):
-        await self.client.aclose()
+        """
+        Releases this manager's clients; they are closed once no manager uses them.
+        """
+        loop = asyncio.get_running_loop()
+        clients, self._clients = self._clients, {}
+        for purpose, client_loop in clients:
+            # Clients of other (closed) loops are dropped by get_shared_client()
+            if client_loop is loop:
+                await release_shared_client(self.api_key, purpose, self._pool_size(purpose))
 
     @retry(
         reraise=True,
         stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type(httpx.RequestError),
+        wait=_wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
+        retry=retry_if_exception(_is_retryable),
     )
-    async def upload_file(self, file_path: str) -> str:
+    async def upload_file(self, name: str, payload: BinaryIO) -> str:
         """
-        Uploads a JSONL file to OpenAI and returns the file ID.
-        Retries on network-related errors.
+        Uploads an in-memory JSONL chunk to OpenAI and returns the file ID.
+        Retries on network errors and transient HTTP errors (429/5xx).
         """
-        logger.info(f"Uploading file: {file_path}")
+        logger.info(f"Uploading file: {name}")
         upload_url = "/v1/files"
-        with open(file_path, 'rb') as f:
-            files = {'file': (os.path.basename(file_path), f, 'application/jsonl')}
-            data = {'purpose': 'batch'}
-            try:
-                response = await self.client.post(upload_url, files=files, data=data)
-                response.raise_for_status()
-                file_id = response.json()['id']
-                logger.info(f"Uploaded file ID: {file_id}")
-                return file_id
-            except httpx.HTTPStatusError as e:
-                logger.error(f"HTTP error during file upload: {e.response.status_code} - {e.response.text}")
-                raise
-            except Exception as e:
-                logger.error(f"Unexpected error during file upload: {e}")
-                raise
+        payload.seek(0)  # Rewind in case this is a retry
+        files = {'file': (name, payload, 'application/jsonl')}
+        data = {'purpose': 'batch'}
+        try:
+            response = await self.client.post(upload_url, files=files, data=data)
+            response.raise_for_status()
+            file_id = response.json()['id']
+            logger.info(f"Uploaded file ID: {file_id}")
+            return file_id
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error during file upload: {e.response.status_code} - {e.response.text}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error during file upload: {e}")
+            raise
 
     @retry(
         reraise=True,
         stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type(httpx.RequestError),
+        wait=_wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
+        retry=retry_if_exception(_is_retryable),
     )
     async def create_batch(self, input_file_id: str, metadata: Optional[Dict[str, str]] = None) -> str:
         """
         Creates a batch job and returns the batch ID.
-        Retries on network-related errors.
+        Retries on network errors and transient HTTP errors (429/5xx).
         """
-        logger.info(f"Creating batch job for file ID: {input_file_id}")
+        logger.info("Creating batch job for file ID: %s", input_file_id)
         create_url = "/v1/batches"
-        payload = {
-            "completion_window": self.completion_window,
-            "endpoint": self.endpoint,
-            "input_file_id": input_file_id,
-        }
+        fields = {"input_file_id": input_file_id}
         if metadata:
-            payload["metadata"] = metadata
+            fields["metadata"] = metadata
+        # Splice the per-batch fields into the pre-serialized template: '{...}' + ',...}'
+        payload = self._create_payload_template[:-1] + b"," + _dumps(fields)[1:]
         try:
-            response = await self.client.post(create_url, json=payload)
+            response = await self.client.post(
+                create_url,
+                content=payload,
+                headers={"Content-Type": "application/json"},
+            )
             response.raise_for_status()
             batch_id = response.json()['id']
-            logger.info(f"Created batch ID: {batch_id}")
+            logger.info("Created batch ID: %s", batch_id)
             return batch_id
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error during batch creation: {e.response.status_code} - {e.response.text}")
@@ -119,21 +308,22 @@ class BatchManager:
     @retry(
         reraise=True,
         stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type(httpx.RequestError),
+        wait=_wait_retry_after(wait_exponential(multiplier=1, min=4, max=10)),
+        retry=retry_if_exception(_is_retryable),
     )
     async def get_batch_status(self, batch_id: str) -> dict:
         """
         Retrieves the status of a batch.
-        Retries on network-related errors.
+        Retries on network errors and transient HTTP errors (429/5xx).
         """
-        logger.debug(f"Checking status for batch ID: {batch_id}")
+        # Lazy %-formatting: this runs on every poll and debug is off by default
+        logger.debug("Checking status for batch ID: %s", batch_id)
         retrieve_url = f"/v1/batches/{batch_id}"
         try:
             response = await self.client.get(retrieve_url)
             response.raise_for_status()
             status_info = response.json()
-            logger.debug(f"Batch {batch_id} status: {status_info.get('status')}")
+            logger.debug("Batch %s status: %s", batch_id, status_info.get('status'))
             return status_info
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error during status retrieval: {e.response.status_code} - {e.response.text}")
@@ -145,88 +335,264 @@ class BatchManager:
     @retry(
         reraise=True,
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=5),
-        retry=retry_if_exception_type(httpx.RequestError),
+        wait=_wait_retry_after(wait_exponential(multiplier=1, min=2, max=5)),
+        retry=retry_if_exception(_is_retryable),
     )
-    async def download_batch_results(self, batch_id: str, output_file: str):
-        """
-        Downloads the results of a completed batch.
-        Retries on network-related errors.
-        """
-        logger.info(f"Downloading results for batch ID: {batch_id} to {output_file}")
-        # Assuming the API provides a URL to download the results
-        # Adjust based on actual API response
-        batch_info = await self.get_batch_status(batch_id)
-        download_url = batch_info.get('output_file_url')
-        if not download_url:
-            logger.error(f"Output file URL not found for batch ID: {batch_id}")
-            raise ValueError("Output file URL not found in batch info.")
+    async def download_file(self, file_id: str, output_file: str):
+        """
+        Streams the content of an uploaded or batch-generated file to disk.
+        Retries on network errors and transient HTTP errors (429/5xx).
+        """
+        download_url = f"/v1/files/{file_id}/content"
         try:
-            response = await self.client.get(download_url)
-            response.raise_for_status()
-            with open(output_file, 'wb') as f:
-                f.write(response.content)
-            logger.info(f"Downloaded results to {output_file}")
+            # Stream the body to disk so memory use stays bounded by the chunk size.
+            # Writes run in the default executor to keep the event loop free, and
+            # bypass the page cache where the platform allows it.
+            loop = asyncio.get_running_loop()
+            async with self.download_client.stream("GET", download_url) as response:
+                if response.is_error:
+                    await response.aread()  # Load the error body for logging
+                response.raise_for_status()
+                # Opening (statvfs, open) and closing (the final flush) touch the
+                # disk too, so they run in the executor alongside the writes
+                f = await loop.run_in_executor(None, DirectFileWriter, output_file, DOWNLOAD_CHUNK_SIZE)
+                try:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await loop.run_in_executor(None, f.write, chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+            logger.info("Downloaded %s to %s", file_id, output_file)
         except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error during result download: {e.response.status_code} - {e.response.text}")
+            logger.error(f"HTTP error during file download: {e.response.status_code} - {e.response.text}")
             raise
         except Exception as e:
-            logger.error(f"Unexpected error during result download: {e}")
+            logger.error(f"Unexpected error during file download: {e}")
             raise
 
-    async def process_batch(self, chunk_file: str):
+    async def download_batch_results(
+        self, batch_info: dict, output_file: str, error_file: Optional[str] = None
+    ) -> List[str]:
+        """
+        Downloads the results of a completed batch, given its final status info,
+        to `output_file`, and the requests that failed to `error_file` (by
+        default errors_<batch ID>.jsonl next to `output_file`). A batch whose
+        requests all failed has only an error file. Returns the files written.
+        """
+        batch_id = batch_info.get('id')
+        if error_file is None:
+            error_file = os.path.join(os.path.dirname(output_file), f"errors_{batch_id}.jsonl")
+        written = []
+        for file_id, path in [(batch_info.get('output_file_id'), output_file),
+                              (batch_info.get('error_file_id'), error_file)]:
+            if file_id:
+                logger.info("Downloading %s for batch ID: %s to %s", file_id, batch_id, path)
+                await self.download_file(file_id, path)
+                written.append(path)
+        if not batch_info.get('output_file_id'):
+            if written:
+                logger.warning(f"Batch {batch_id} produced no results; failed requests are in {error_file}")
+            else:
+                logger.warning(f"Batch {batch_id} produced no output or error file")
+        return written
+
+    async def wait_for_batch(self, batch_id: str) -> dict:
+        """
+        Polls a batch until it reaches a terminal status and returns the final
+        status info. Raises BatchFailedError if the batch failed, was cancelled
+        or expired.
+        """
+        # The poll interval backs off exponentially (with jitter) while the
+        # status is unchanged and resets whenever the status transitions.
+        last_status = None
+        delay = POLL_INITIAL_DELAY
+        while True:
+            status_info = await self.get_batch_status(batch_id)
+            status = status_info.get('status')
+            if status in SUCCEEDED_STATUSES:
+                logger.info(f"Batch {batch_id} ended with status: {status}")
+                return status_info
+            elif status in FAILED_STATUSES:
+                raise BatchFailedError(batch_id, status)
+
+            if status != last_status:
+                counts = status_info.get('request_counts') or {}
+                logger.info(
+                    f"Batch {batch_id} status: {status} "
+                    f"({counts.get('completed', 0)}/{counts.get('total', 0)} requests completed)"
+                )
+                delay = POLL_INITIAL_DELAY
+                last_status = status
+            else:
+                delay = min(delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))  # Wait before next poll
+
+    async def process_batch(self, name: str, payload: BinaryIO):
         """
         Handles the entire lifecycle of a single batch.
         """
         try:
-            file_id = await self.upload_file(chunk_file)
+            file_id = await self.upload_file(name, payload)
             batch_id = await self.create_batch(file_id)
-
-            # Polling for batch completion with progress tracking
-            status = None
-            with tqdm_asyncio(total=100, desc=f"Batch {batch_id}", unit="%", leave=True) as pbar:
-                while True:
-                    status_info = await self.get_batch_status(batch_id)
-                    status = status_info.get('status')
-                    if status == 'succeeded':
-                        pbar.update(100 - pbar.n)  # Complete the progress bar
-                        break
-                    elif status in ['failed', 'cancelled']:
-                        pbar.write(f"Batch {batch_id} ended with status: {status}")
-                        raise RuntimeError(f"Batch {batch_id} ended with status: {status}")
-                    else:
-                        # Update progress bar based on some logic or keep it indeterminate
-                        pbar.update(10)  # Example: increment progress
-                        await asyncio.sleep(30)  # Wait before next poll
-
-            # Download results if succeeded
-            if status == 'succeeded':
-                output_file = f"{self.output_dir}/results_{batch_id}.jsonl"
-                await self.download_batch_results(batch_id, output_file)
+            batch_info = await self.wait_for_batch(batch_id)
+            output_file = f"{self.output_dir}/results_{batch_id}.jsonl"
+            await self.download_batch_results(batch_info, output_file)
         except Exception as e:
-            logger.error(f"Error processing batch for file {chunk_file}: {e}")
+            logger.error(f"Error processing batch for chunk {name}: {e}")
             raise
 
-    async def process_batches(self, chunk_files: List[str]):
+    async def process_batches(
+        self,
+        chunks: AsyncIterator[Tuple[str, BinaryIO]],
+        fingerprint: Optional[Dict[str, str]] = None,
+    ):
         """
-        Processes multiple batches sequentially with progress tracking and clean-up.
+        Processes batches through a pipeline of upload, poll and download stages,
+        with a single progress bar that advances as each chunk finishes.
+
+        Each stage has `max_concurrency` workers connected by queues, so new
+        chunks keep uploading while earlier batches are still polling. A chunk's
+        payload is dropped once its batch is created, and the next chunk is only
+        read from `chunks` when fewer than `max_concurrency` payloads are held,
+        so at most `max_concurrency` chunks are in memory at a time.
+        Chunks that fail before their batch is created are written to the output
+        directory for re-processing; later failures are reported by batch ID.
+
+        Progress is recorded per chunk in a state database in the output
+        directory. With `resume`, chunks already submitted by an earlier run
+        pick up where they left off instead of being uploaded again. Pass the
+        run's `fingerprint` (see state.run_fingerprint) so resuming with a
+        different input or chunking raises ResumeStateMismatchError instead of
+        matching old batches to the wrong lines.
         """
         ensure_directory(self.output_dir)
+        state = BatchState(os.path.join(self.output_dir, STATE_DB_NAME), reset=not self.resume)
+        if fingerprint is not None:
+            try:
+                state.check_fingerprint(fingerprint)
+            except Exception:
+                state.close()
+                raise
+
+        loop = asyncio.get_running_loop()
         failed_batches = []
-        processed_files = []
 
-        for chunk_file in tqdm_asyncio(chunk_files, desc="Processing Batches", unit="batch"):
+        async def save_state(name: str, **fields):
+            # State commits touch the disk, so they run in the executor
+            await loop.run_in_executor(None, functools.partial(state.update, name, **fields))
+
+        # One slot per chunk payload held in memory (queued or uploading)
+        payload_slots = asyncio.Semaphore(self.max_concurrency)
+        upload_q = asyncio.Queue()
+        poll_q = asyncio.Queue()
+        download_q = asyncio.Queue()
+
+        async def upload(name: str, payload: BinaryIO):
             try:
-                await self.process_batch(chunk_file)
-                processed_files.append(chunk_file)
-            except Exception as e:
-                logger.error(f"Failed to process batch for file {chunk_file}: {e}")
-                failed_batches.append(chunk_file)
+                record = await loop.run_in_executor(None, state.get, name) or {}
+                if record.get('status') == DOWNLOADED:
+                    logger.info(f"Skipping chunk {name}: results already downloaded")
+                    pbar.update(1)
+                    return None
+                if record.get('batch_id') and record.get('status') not in FAILED_STATUSES:
+                    logger.info(f"Resuming batch {record['batch_id']} for chunk {name}")
+                    return name, record['batch_id']
+                try:
+                    # Reuse a file uploaded by a run that died before creating its batch
+                    file_id = record.get('file_id') if record.get('status') == UPLOADED else None
+                    if not file_id:
+                        file_id = await self.upload_file(name, payload)
+                        await save_state(name, file_id=file_id, batch_id=None, status=UPLOADED)
+                    batch_id = await self.create_batch(file_id)
+                    await save_state(name, batch_id=batch_id, status=SUBMITTED)
+                except Exception:
+                    await loop.run_in_executor(None, self._save_failed_chunk, name, payload)
+                    raise
+                return name, batch_id
+            finally:
+                payload_slots.release()  # The payload isn't needed past this stage
+
+        async def poll(name: str, batch_id: str):
+            try:
+                batch_info = await self.wait_for_batch(batch_id)
+            except BatchFailedError as e:
+                # Other errors leave the chunk submitted, so --resume polls it again
+                await save_state(name, status=e.status)
+                raise
+            await save_state(name, status=batch_info.get('status'))
+            return name, batch_info
 
-        # Clean up successfully processed chunk files
-        clean_up_files(processed_files, logger)
+        async def download(name: str, batch_info: dict):
+            output_file = f"{self.output_dir}/results_{batch_info['id']}.jsonl"
+            written = await self.download_batch_results(batch_info, output_file)
+            # Nothing is left to fetch even when every request failed
+            await save_state(name, status=DOWNLOADED, output_file=output_file if output_file in written else None)
+            pbar.update(1)
 
-        if failed_batches:
+        async def worker(in_q: asyncio.Queue, handler, out_q: Optional[asyncio.Queue]):
+            while True:
+                item = await in_q.get()
+                try:
+                    result = await handler(*item)
+                    if out_q is not None and result is not None:
+                        await out_q.put(result)
+                except asyncio.CancelledError:
+                    raise  # An Exception subclass before Python 3.8, so re-raise it before the generic handler
+                except Exception as e:
+                    logger.error(f"Failed to process batch for chunk {item[0]}: {e}")
+                    failed_batches.append(item[0])
+                    pbar.update(1)
+                finally:
+                    in_q.task_done()
+                    # Don't keep the finished item (and its payload) alive while idle
+                    item = result = None
+
+        stages = [(upload_q, upload, poll_q), (poll_q, poll, download_q), (download_q, download, None)]
+        n_chunks = 0
+        with tqdm_asyncio(desc="Processing Batches", unit="batch") as pbar:
+            workers = [
+                asyncio.ensure_future(worker(in_q, handler, out_q))
+                for in_q, handler, out_q in stages
+                for _ in range(self.max_concurrency)
+            ]
+            try:
+                iterator = chunks.__aiter__()
+                while True:
+                    # Take a slot before reading the next chunk to bound memory use
+                    await payload_slots.acquire()
+                    try:
+                        name, payload = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        payload_slots.release()
+                        break
+                    await upload_q.put((name, payload))
+                    n_chunks += 1
+                    pbar.total = n_chunks
+                    pbar.refresh()
+                # Items only move forward, so draining the stages in order is enough
+                for in_q, _, _ in stages:
+                    await in_q.join()
+            finally:
+                for w in workers:
+                    w.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                state.close()
+
+        if not n_chunks:
+            logger.warning("No chunks were created. Please check the input file and chunk size.")
+        elif failed_batches:
             logger.warning(f"The following batches failed to process: {failed_batches}")
         else:
             logger.info("All batches processed successfully.")
+
+    def _save_failed_chunk(self, name: str, payload: BinaryIO):
+        """
+        Persists a chunk that failed to process so it is not lost.
+        """
+        failed_file = os.path.join(self.output_dir, f"failed_{name}")
+        try:
+            payload.seek(0)
+            with open(failed_file, 'wb') as f:
+                f.write(payload.read())
+            logger.info(f"Saved failed chunk to {failed_file}")
+        except Exception as e:
+            logger.error(f"Failed to save chunk {name}: {e}")
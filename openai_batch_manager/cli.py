@@ -4,7 +4,8 @@ import asyncio
 import click
 import logging
 from openai_batch_manager.batch_manager import BatchManager
-from openai_batch_manager.utils import split_jsonl_file, ensure_directory, clean_up_files
+from openai_batch_manager.utils import iter_chunks, DEFAULT_MAX_CHUNK_BYTES
+from openai_batch_manager.state import ResumeStateMismatchError, run_fingerprint
 from openai_batch_manager.jsonl_helper import csv_to_jsonl, validate_jsonl, create_jsonl_manual
 from openai_batch_manager.config import (
     API_KEY,
@@ -13,6 +14,12 @@ from openai_batch_manager.config import (
 )
 from tqdm.asyncio import tqdm_asyncio
 
+# Use the faster libuv-based event loop when it is installed
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Configure root logger
 logging.basicConfig(
     level=logging.INFO,
@@ -53,8 +60,15 @@ def cli():
     '-c',
     default=1000,
     show_default=True,
-    type=int,
-    help='Number of lines per chunk.'
+    type=click.IntRange(min=1),
+    help='Maximum number of lines per chunk.'
+)
+@click.option(
+    '--max-bytes',
+    default=DEFAULT_MAX_CHUNK_BYTES,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Maximum size of a chunk in bytes.'
 )
 @click.option(
     '--completion-window',
@@ -70,12 +84,30 @@ def cli():
     type=str,
     help='API endpoint to use for batch processing.'
 )
-def process(input, output, chunk_size, completion_window, endpoint):
+@click.option(
+    '--max-concurrency',
+    '-m',
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help='Number of concurrent workers per stage (upload, poll, download).'
+)
+@click.option(
+    '--resume',
+    is_flag=True,
+    default=False,
+    help='Resume a previous run into the same output directory instead of re-uploading its chunks.'
+)
+def process(input, output, chunk_size, max_bytes, completion_window, endpoint, max_concurrency, resume):
     """
     Process a JSONL file by splitting it into chunks, uploading batches,
-    polling for completion, downloading results, and cleaning up.
+    polling for completion, and downloading results.
     """
-    asyncio.run(run_batch_processing(input, output, chunk_size, completion_window, endpoint))
+    run = uvloop.run if uvloop is not None else asyncio.run
+    try:
+        run(run_batch_processing(input, output, chunk_size, completion_window, endpoint, max_concurrency, max_bytes, resume))
+    except ResumeStateMismatchError as e:
+        raise click.ClickException(str(e))
 
 
 @cli.group()
@@ -160,7 +192,16 @@ def create_jsonl_manual_command(jsonl_file, record):
     click.echo(f"JSONL file '{jsonl_file}' created with {len(records)} records.")
 
 
-async def run_batch_processing(input_file, output_dir, chunk_size, completion_window, endpoint):
+async def run_batch_processing(
+    input_file,
+    output_dir,
+    chunk_size,
+    completion_window,
+    endpoint,
+    max_concurrency=4,
+    max_bytes=DEFAULT_MAX_CHUNK_BYTES,
+    resume=False,
+):
     from openai_batch_manager.batch_manager import BatchManager  # Import inside function to avoid circular imports
 
     # Initialize BatchManager
@@ -168,21 +209,21 @@ async def run_batch_processing(input_file, output_dir, chunk_size, completion_wi
         api_key=API_KEY,
         endpoint=endpoint,
         completion_window=completion_window,
-        output_dir=output_dir
+        output_dir=output_dir,
+        max_concurrency=max_concurrency,
+        resume=resume,
     )
 
     try:
-        # Split the large JSONL file into chunks
+        # Split the large JSONL file into in-memory chunks and process them
+        # concurrently with progress tracking
         logging.info("Splitting the input JSONL file into chunks...")
-        chunk_files = split_jsonl_file(input_file, chunk_size)
-        logging.info(f"Total chunks created: {len(chunk_files)}")
-
-        if not chunk_files:
-            logging.warning("No chunks were created. Please check the input file and chunk size.")
-            return
-
-        # Process each batch sequentially with progress tracking
-        await manager.process_batches(chunk_files)
+        await manager.process_batches(
+            iter_chunks(input_file, chunk_size, max_bytes),
+            fingerprint=run_fingerprint(input_file, chunk_size, max_bytes),
+        )
+    except ResumeStateMismatchError:
+        raise
     except Exception as e:
         logging.error(f"An error occurred during batch processing: {e}")
     finally:
@@ -1,9 +1,27 @@
 import csv
 import json
+import mmap
 import os
-from typing import List, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, List, Dict, Optional, Tuple
 import logging
 
+# Optional fast paths: pyarrow for CSV parsing, orjson for JSON encoding/decoding
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+    pacsv = None
+
+# Files smaller than this are validated in-process; a worker pool isn't worth it
+PARALLEL_VALIDATE_MIN_BYTES = 16 * 1024 * 1024
+
 logger = logging.getLogger("JSONLHelper")
 logger.setLevel(logging.INFO)
 formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
@@ -19,46 +37,157 @@ fh.setFormatter(formatter)
 logger.addHandler(fh)
 
 
+def _dumps_line(record: Dict) -> bytes:
+    """
+    Serializes a record as a newline-terminated JSON line.
+    """
+    if orjson is not None:
+        return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+    return (json.dumps(record) + '\n').encode('utf-8')
+
+
+def _loads(line: bytes):
+    """
+    Parses a single JSON line.
+    """
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+def _csv_to_jsonl_arrow(csv_file: str, f_jsonl: BinaryIO):
+    if os.path.getsize(csv_file) == 0:
+        return
+    # Read every column as a string to match csv.DictReader. Take the column
+    # names from pyarrow itself so they match exactly (e.g. with a BOM stripped).
+    names = pacsv.open_csv(csv_file).schema.names
+    convert_options = pacsv.ConvertOptions(column_types={name: pa.string() for name in names})
+    reader = pacsv.open_csv(csv_file, convert_options=convert_options)
+    for batch in reader:
+        f_jsonl.write(b"".join(_dumps_line(row) for row in batch.to_pylist()))
+
+
+def _csv_to_jsonl_stdlib(csv_file: str, f_jsonl: BinaryIO):
+    # utf-8-sig drops a leading BOM, as pyarrow does, instead of leaving it in the first key
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f_csv:
+        reader = csv.DictReader(f_csv)
+        for row in reader:
+            f_jsonl.write(_dumps_line(row))
+
+
 def csv_to_jsonl(csv_file: str, jsonl_file: str):
     """
     Converts a CSV file to a JSONL file.
 
+    Uses pyarrow's vectorized CSV reader when available and falls back to
+    csv.DictReader otherwise, or if pyarrow cannot parse the file.
+
     Args:
         csv_file (str): Path to the input CSV file.
         jsonl_file (str): Path to the output JSONL file.
     """
     logger.info(f"Converting CSV '{csv_file}' to JSONL '{jsonl_file}'")
     try:
-        with open(csv_file, 'r', encoding='utf-8') as f_csv, open(jsonl_file, 'w', encoding='utf-8') as f_jsonl:
-            reader = csv.DictReader(f_csv)
-            for row in reader:
-                json_line = json.dumps(row)
-                f_jsonl.write(json_line + '\n')
+        with open(jsonl_file, 'wb') as f_jsonl:
+            converted = False
+            if pacsv is not None:
+                try:
+                    _csv_to_jsonl_arrow(csv_file, f_jsonl)
+                    converted = True
+                except pa.ArrowInvalid as e:
+                    logger.warning(f"pyarrow could not parse '{csv_file}', falling back to csv module: {e}")
+                    f_jsonl.seek(0)
+                    f_jsonl.truncate()
+            if not converted:
+                _csv_to_jsonl_stdlib(csv_file, f_jsonl)
         logger.info(f"Successfully converted '{csv_file}' to '{jsonl_file}'")
     except Exception as e:
         logger.error(f"Error converting CSV to JSONL: {e}")
         raise
 
 
-def validate_jsonl(jsonl_file: str) -> bool:
+def _validate_range(jsonl_file: str, start: int, end: int) -> Tuple[int, Optional[int], Optional[str]]:
+    """
+    Parses the lines in the byte range [start, end) of a JSONL file.
+    The range must begin at the start of a line.
+
+    Returns:
+        Tuple[int, Optional[int], Optional[str]]: The number of lines parsed and,
+        for the first invalid line, its 1-based index within the range and the error.
+    """
+    with open(jsonl_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        line_count = 0
+        pos = start
+        while pos < end:
+            newline = mm.find(b'\n', pos, end)
+            line_end = end if newline == -1 else newline + 1
+            line_count += 1
+            try:
+                _loads(mm[pos:line_end])
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                return line_count, line_count, str(e)
+            pos = line_end
+        return line_count, None, None
+
+
+def _split_ranges(jsonl_file: str, size: int, n: int) -> List[Tuple[int, int]]:
+    """
+    Splits a file into up to `n` byte ranges aligned on line boundaries.
+    """
+    boundaries = [0]
+    with open(jsonl_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(1, n):
+            target = max(size * i // n, boundaries[-1])
+            newline = mm.find(b'\n', target)
+            boundary = size if newline == -1 else newline + 1
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def validate_jsonl(jsonl_file: str, workers: Optional[int] = None) -> bool:
     """
     Validates the format of a JSONL file.
 
+    Large files are split into line-aligned byte ranges that are parsed in
+    parallel worker processes.
+
     Args:
         jsonl_file (str): Path to the JSONL file.
+        workers (Optional[int]): Number of worker processes. Defaults to the CPU count.
 
     Returns:
         bool: True if valid, False otherwise.
     """
     logger.info(f"Validating JSONL file '{jsonl_file}'")
     try:
-        with open(jsonl_file, 'r', encoding='utf-8') as f:
-            for line_number, line in enumerate(f, start=1):
-                try:
-                    json.loads(line)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid JSON at line {line_number}: {e}")
-                    return False
+        size = os.stat(jsonl_file).st_size
+        if size == 0:
+            logger.info(f"JSONL file '{jsonl_file}' is valid")
+            return True
+
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and size >= PARALLEL_VALIDATE_MIN_BYTES:
+            ranges = _split_ranges(jsonl_file, size, workers)
+            with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+                results = list(executor.map(
+                    _validate_range,
+                    [jsonl_file] * len(ranges),
+                    [start for start, _ in ranges],
+                    [end for _, end in ranges],
+                ))
+        else:
+            results = [_validate_range(jsonl_file, 0, size)]
+
+        # Ranges are in file order, so the first failing range has the first bad line
+        lines_before = 0
+        for line_count, bad_line, error in results:
+            if bad_line is not None:
+                logger.error(f"Invalid JSON at line {lines_before + bad_line}: {error}")
+                return False
+            lines_before += line_count
         logger.info(f"JSONL file '{jsonl_file}' is valid")
         return True
     except Exception as e:
@@ -76,10 +205,8 @@ def create_jsonl_manual(jsonl_file: str, records: List[Dict]):
     """
     logger.info(f"Creating JSONL file '{jsonl_file}' from manual input")
     try:
-        with open(jsonl_file, 'w', encoding='utf-8') as f_jsonl:
-            for record in records:
-                json_line = json.dumps(record)
-                f_jsonl.write(json_line + '\n')
+        with open(jsonl_file, 'wb') as f_jsonl:
+            f_jsonl.write(b"".join(_dumps_line(record) for record in records))
         logger.info(f"Successfully created JSONL file '{jsonl_file}'")
     except Exception as e:
         logger.error(f"Error creating JSONL file: {e}")
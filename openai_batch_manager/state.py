@@ -0,0 +1,154 @@
+# openai_batch_manager/state.py
+
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+# Local statuses recorded alongside the batch statuses reported by the API
+UPLOADED = "uploaded"
+SUBMITTED = "submitted"
+DOWNLOADED = "downloaded"
+
+_COLUMNS = ("file_id", "batch_id", "status", "output_file")
+
+
+class ResumeStateMismatchError(ValueError):
+    """
+    Raised when resuming a run whose input or chunking differs from the run
+    that recorded the state.
+    """
+
+
+def run_fingerprint(input_file: str, chunk_size: int, max_bytes: int) -> Dict[str, str]:
+    """
+    Describes the input and chunking options that determine which lines end up
+    in which chunk, so a resumed run can be checked against the original.
+
+    Args:
+        input_file (str): Path to the input JSONL file.
+        chunk_size (int): Maximum number of lines per chunk.
+        max_bytes (int): Maximum size of a chunk in bytes.
+
+    Returns:
+        Dict[str, str]: The fingerprint, as stored in the state database.
+    """
+    stat = os.stat(input_file)
+    return {
+        "input_file": os.path.abspath(input_file),
+        "input_size": str(stat.st_size),
+        "input_mtime": str(stat.st_mtime_ns),
+        "chunk_size": str(chunk_size),
+        "max_bytes": str(max_bytes),
+    }
+
+
+class BatchState:
+    """
+    Persists the progress of each chunk in a local SQLite database so an
+    interrupted run can be resumed without re-uploading its chunks.
+
+    The connection may be used from any thread (e.g. an executor, to keep
+    commits off the event loop); calls are serialized by a lock.
+
+    Args:
+        path (str): Path to the SQLite database file.
+        reset (bool): Discard any previously recorded state.
+    """
+
+    def __init__(self, path: str, reset: bool = False):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        # WAL keeps the frequent small writes cheap and the file readable meanwhile;
+        # with WAL, NORMAL only syncs at checkpoints and still can't corrupt the file
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_name TEXT PRIMARY KEY,
+                    file_id TEXT,
+                    batch_id TEXT,
+                    status TEXT,
+                    output_file TEXT
+                )
+                """
+            )
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+                """
+            )
+            if reset:
+                self.conn.execute("DELETE FROM chunks")
+                self.conn.execute("DELETE FROM meta")
+
+    def check_fingerprint(self, fingerprint: Dict[str, str]):
+        """
+        Records the run fingerprint, or verifies it against the one already
+        recorded. Raises ResumeStateMismatchError if they differ, or if chunk
+        state exists without a fingerprint to verify it against.
+        """
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+
+    def _check_fingerprint(self, fingerprint: Dict[str, str]):
+        stored = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+        if stored:
+            if stored != fingerprint:
+                differing = sorted(
+                    key for key in set(stored) | set(fingerprint)
+                    if stored.get(key) != fingerprint.get(key)
+                )
+                raise ResumeStateMismatchError(
+                    f"Cannot resume from '{self.path}': the input file or chunking options "
+                    f"differ from the original run ({', '.join(differing)}). Re-run with the "
+                    f"same input and options, or without --resume to start over."
+                )
+            return
+        if self.conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is not None:
+            raise ResumeStateMismatchError(
+                f"Cannot resume from '{self.path}': it records no input fingerprint to check "
+                f"against. Re-run without --resume to start over."
+            )
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)", list(fingerprint.items())
+            )
+
+    def get(self, chunk_name: str) -> Optional[Dict[str, Optional[str]]]:
+        """
+        Returns the recorded state of a chunk, or None if it has none.
+        """
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM chunks WHERE chunk_name = ?", (chunk_name,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def update(self, chunk_name: str, **fields: Optional[str]):
+        """
+        Records the given fields (file_id, batch_id, status, output_file) for a chunk.
+        """
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown state fields: {sorted(unknown)}")
+        # INSERT OR IGNORE + UPDATE rather than an upsert, which needs SQLite 3.24
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO chunks (chunk_name) VALUES (?)", (chunk_name,))
+            if fields:
+                self.conn.execute(
+                    f"UPDATE chunks SET {', '.join(f'{column} = ?' for column in fields)} "
+                    f"WHERE chunk_name = ?",
+                    list(fields.values()) + [chunk_name],
+                )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
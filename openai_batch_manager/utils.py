@@ -1,41 +1,121 @@
 # openai_batch_manager/utils.py
 
+import asyncio
+import errno
+import io
+import mmap
 import os
-from typing import List
+from typing import AsyncIterator, BinaryIO, List, Tuple
 import logging
 
-def split_jsonl_file(input_file: str, chunk_size: int) -> List[str]:
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows
+
+# Default cap on chunk size, kept under OpenAI's 200 MB batch input limit
+DEFAULT_MAX_CHUNK_BYTES = 180 * 1024 * 1024
+
+def _check_chunk_limits(chunk_size: int, max_bytes: int):
+    """
+    Rejects chunk limits that would make every chunk empty.
+    """
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+    if max_bytes < 1:
+        raise ValueError(f"max_bytes must be at least 1, got {max_bytes}")
+
+def _find_chunk_end(mm: mmap.mmap, start: int, chunk_size: int, max_bytes: int) -> int:
+    """
+    Returns the offset just past the last line of the chunk starting at `start`.
+    A chunk ends after `chunk_size` lines, before the line that would take it
+    past `max_bytes`, or at the end of the file. A single line larger than
+    `max_bytes` becomes a chunk of its own.
+    """
+    limit = start + max_bytes
+    pos = start
+    for _ in range(chunk_size):
+        newline = mm.find(b"\n", pos)
+        line_end = len(mm) if newline == -1 else newline + 1
+        if line_end > limit and pos > start:
+            break
+        pos = line_end
+        if newline == -1:
+            break
+    return pos
+
+def split_jsonl_file(input_file: str, chunk_size: int, max_bytes: int = DEFAULT_MAX_CHUNK_BYTES) -> List[str]:
     """
     Splits a large JSONL file into smaller chunks.
 
     Args:
         input_file (str): Path to the input JSONL file.
-        chunk_size (int): Number of lines per chunk.
+        chunk_size (int): Maximum number of lines per chunk.
+        max_bytes (int): Maximum size of a chunk in bytes.
 
     Returns:
         List[str]: List of file paths for the created chunks.
     """
+    _check_chunk_limits(chunk_size, max_bytes)
     chunk_files = []
-    with open(input_file, 'r', encoding='utf-8') as infile:
-        chunk = []
+    if os.path.getsize(input_file) == 0:
+        return chunk_files  # mmap can't map an empty file
+    # Lines are copied verbatim, so find chunk boundaries in the mapped bytes
+    # and write each chunk straight from the mapping
+    with open(input_file, 'rb') as infile, \
+            mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            memoryview(mm) as view:
+        pos = 0
         chunk_index = 1
-        for line_number, line in enumerate(infile, start=1):
-            chunk.append(line)
-            if line_number % chunk_size == 0:
-                chunk_filename = f"{input_file}_chunk_{chunk_index}.jsonl"
-                with open(chunk_filename, 'w', encoding='utf-8') as chunk_file:
-                    chunk_file.writelines(chunk)
-                chunk_files.append(chunk_filename)
-                chunk = []
-                chunk_index += 1
-        # Write remaining lines
-        if chunk:
+        while pos < len(mm):
+            end = _find_chunk_end(mm, pos, chunk_size, max_bytes)
             chunk_filename = f"{input_file}_chunk_{chunk_index}.jsonl"
-            with open(chunk_filename, 'w', encoding='utf-8') as chunk_file:
-                chunk_file.writelines(chunk)
+            with open(chunk_filename, 'wb') as chunk_file:
+                chunk_file.write(view[pos:end])
             chunk_files.append(chunk_filename)
+            pos = end
+            chunk_index += 1
     return chunk_files
 
+async def iter_chunks(
+    input_file: str,
+    chunk_size: int,
+    max_bytes: int = DEFAULT_MAX_CHUNK_BYTES,
+) -> AsyncIterator[Tuple[str, BinaryIO]]:
+    """
+    Splits a large JSONL file into in-memory chunks without writing them to disk.
+
+    Args:
+        input_file (str): Path to the input JSONL file.
+        chunk_size (int): Maximum number of lines per chunk.
+        max_bytes (int): Maximum size of a chunk in bytes.
+
+    Yields:
+        Tuple[str, BinaryIO]: The chunk name and a buffer holding its bytes.
+    """
+    _check_chunk_limits(chunk_size, max_bytes)
+    if os.path.getsize(input_file) == 0:
+        return  # mmap can't map an empty file
+    base_name = os.path.basename(input_file)
+    loop = asyncio.get_running_loop()
+    with open(input_file, 'rb') as infile, \
+            mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        chunk_index = 1
+        while pos < len(mm):
+            # Copy a whole chunk per executor call so the event loop isn't blocked on disk
+            end, data = await loop.run_in_executor(None, _read_chunk, mm, pos, chunk_size, max_bytes)
+            yield f"{base_name}_chunk_{chunk_index}.jsonl", io.BytesIO(data)
+            pos = end
+            chunk_index += 1
+
+def _read_chunk(mm: mmap.mmap, start: int, chunk_size: int, max_bytes: int) -> Tuple[int, bytes]:
+    """
+    Reads the chunk starting at `start` and returns its end offset and bytes.
+    """
+    end = _find_chunk_end(mm, start, chunk_size, max_bytes)
+    return end, mm[start:end]
+
 def ensure_directory(path: str):
     """
     Ensures that the specified directory exists.
@@ -60,3 +140,107 @@ def clean_up_files(file_paths: List[str], logger: logging.Logger):
             logger.info(f"Deleted temporary file: {file_path}")
         except Exception as e:
             logger.error(f"Failed to delete {file_path}: {e}")
+
+class DirectFileWriter:
+    """
+    Writes a file with O_DIRECT where supported (Linux), bypassing the page cache
+    so large downloads don't evict other processes' cached pages.
+
+    Data is staged in a page-aligned buffer, as O_DIRECT requires, and written
+    in whole buffers. The final unaligned tail is written with O_DIRECT cleared.
+    Falls back to ordinary buffered writes when O_DIRECT is unavailable or the
+    filesystem rejects it.
+
+    Args:
+        path (str): Path to the output file.
+        buffer_size (int): Size of the staging buffer; a multiple of the page size.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20):
+        self.path = path
+        self._length = 0
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+        self.direct = self._direct_supported(path, buffer_size)
+        self._fd = None
+        if self.direct:
+            try:
+                self._fd = os.open(path, flags | os.O_DIRECT, 0o644)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                self.direct = False
+        if self._fd is None:
+            self._fd = os.open(path, flags, 0o644)
+        # Allocate the buffer only once the file is open, so a failed open leaks nothing
+        try:
+            self._buffer = mmap.mmap(-1, buffer_size)  # Anonymous mappings are page-aligned
+        except BaseException:
+            os.close(self._fd)
+            self._fd = None
+            raise
+        self._view = memoryview(self._buffer)
+
+    @staticmethod
+    def _direct_supported(path: str, buffer_size: int) -> bool:
+        if not hasattr(os, 'O_DIRECT') or fcntl is None or buffer_size % mmap.PAGESIZE:
+            return False
+        try:
+            block_size = os.statvfs(os.path.dirname(os.path.abspath(path))).f_bsize
+        except OSError:
+            return False
+        return block_size > 0 and buffer_size % block_size == 0
+
+    def write(self, data: bytes) -> int:
+        data = memoryview(data)
+        size = len(self._buffer)
+        written = 0
+        while written < len(data):
+            n = min(size - self._length, len(data) - written)
+            self._view[self._length:self._length + n] = data[written:written + n]
+            self._length += n
+            written += n
+            if self._length == size:
+                self._write_all(self._view)
+                self._length = 0
+        return written
+
+    def _write_all(self, data: memoryview):
+        while len(data):
+            try:
+                n = os.write(self._fd, data)
+            except OSError as e:
+                if not self.direct or e.errno != errno.EINVAL:
+                    raise
+                self._disable_direct()  # The filesystem rejected O_DIRECT writes
+                continue
+            data = data[n:]
+
+    def _disable_direct(self):
+        if self.direct:
+            flags = fcntl.fcntl(self._fd, fcntl.F_GETFL)
+            fcntl.fcntl(self._fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+            self.direct = False
+
+    def close(self):
+        if self._fd is None:
+            return
+        try:
+            if self._length:
+                # Write the aligned part directly, then the tail without O_DIRECT
+                aligned = self._length - self._length % mmap.PAGESIZE
+                if aligned:
+                    self._write_all(self._view[:aligned])
+                self._disable_direct()
+                self._write_all(self._view[aligned:self._length])
+            self._length = 0
+        finally:
+            os.close(self._fd)
+            self._fd = None
+            self._view.release()
+            self._buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -17,13 +17,20 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=[
-        "httpx",
+        "httpx[http2]",
         "asyncio",
         "tqdm",
         "python-dotenv",
         "tenacity",
         "click",
     ],
+    extras_require={
+        "fast": [
+            "orjson",
+            "pyarrow",
+            "uvloop>=0.18; sys_platform != 'win32' and python_version >= '3.8'",
+        ],
+    },
     entry_points={
         "console_scripts": [
             "openai-batch-manager=openai_batch_manager.cli:main",
@@ -1,26 +1,364 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
 import unittest
-from unittest.mock import patch, AsyncMock
-from openai_batch_manager.batch_manager import BatchManager
+import httpx
+from tenacity import wait_exponential
+from unittest.mock import patch, AsyncMock, MagicMock
+from openai_batch_manager.batch_manager import BatchFailedError, BatchManager, RETRY_AFTER_MAX, STATE_DB_NAME, _is_retryable, _wait_retry_after
+from openai_batch_manager.state import BatchState, ResumeStateMismatchError, run_fingerprint
 
 class TestBatchManager(unittest.IsolatedAsyncioTestCase):
 
+    def setUp(self):
+        # Don't let shared clients (mocked or real) leak between tests
+        patcher = patch.dict('openai_batch_manager.batch_manager._shared_clients', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
     async def test_upload_file_success(self, mock_client):
         # Setup
-        mock_response = AsyncMock()
+        mock_response = MagicMock()
         mock_response.json.return_value = {'id': 'file_123'}
-        mock_response.raise_for_status = AsyncMock()
-        mock_client.return_value.post.return_value = mock_response
+        mock_client.return_value.post = AsyncMock(return_value=mock_response)
 
         manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
 
         # Execute
-        file_id = await manager.upload_file('test.jsonl')
+        file_id = await manager.upload_file('test.jsonl', io.BytesIO(b'{}\n'))
 
         # Assert
         self.assertEqual(file_id, 'file_123')
         mock_client.return_value.post.assert_called_once()
 
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_process_batches_collects_failures(self, mock_client):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir=output_dir, max_concurrency=2)
+
+        async def chunks():
+            for name in ['a.jsonl', 'bad.jsonl', 'b.jsonl']:
+                yield name, io.BytesIO(b'{}\n')
+
+        async def fake_upload_file(name, payload):
+            if name == 'bad.jsonl':
+                raise RuntimeError("boom")
+            return f"file_{name}"
+
+        async def fake_create_batch(file_id):
+            return file_id.replace('file_', 'batch_')
+
+        async def fake_wait_for_batch(batch_id):
+            return {'id': batch_id, 'status': 'completed', 'output_file_id': f"file_{batch_id}"}
+
+        with patch.object(manager, 'upload_file', side_effect=fake_upload_file), \
+                patch.object(manager, 'create_batch', side_effect=fake_create_batch), \
+                patch.object(manager, 'wait_for_batch', side_effect=fake_wait_for_batch), \
+                patch.object(manager, 'download_batch_results', AsyncMock()) as mock_download, \
+                patch.object(manager, '_save_failed_chunk') as mock_save:
+            await manager.process_batches(chunks())
+
+        mock_save.assert_called_once()
+        self.assertEqual(mock_save.call_args[0][0], 'bad.jsonl')
+        downloaded = sorted(call.args[0]['id'] for call in mock_download.call_args_list)
+        self.assertEqual(downloaded, ['batch_a.jsonl', 'batch_b.jsonl'])
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_process_batches_bounds_payloads_in_memory(self, mock_client):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir=output_dir, max_concurrency=2)
+        held = set()
+        peak = 0
+        release_uploads = asyncio.Event()
+
+        async def chunks():
+            nonlocal peak
+            for i in range(6):
+                held.add(i)
+                peak = max(peak, len(held))
+                yield str(i), io.BytesIO(b'{}\n')
+
+        async def fake_upload_file(name, payload):
+            await release_uploads.wait()
+            held.discard(int(name))
+            return f"file_{name}"
+
+        async def fake_wait_for_batch(batch_id):
+            return {'id': batch_id, 'status': 'completed', 'output_file_id': 'out'}
+
+        with patch.object(manager, 'upload_file', side_effect=fake_upload_file), \
+                patch.object(manager, 'create_batch', AsyncMock(side_effect=lambda file_id: f"batch_{file_id}")), \
+                patch.object(manager, 'wait_for_batch', side_effect=fake_wait_for_batch), \
+                patch.object(manager, 'download_batch_results', AsyncMock()):
+            task = asyncio.ensure_future(manager.process_batches(chunks()))
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(held), 2)  # Producer is blocked until an upload finishes
+            release_uploads.set()
+            await task
+
+        self.assertLessEqual(peak, 2)
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_process_batches_resume(self, mock_client):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        state = BatchState(os.path.join(output_dir, STATE_DB_NAME))
+        state.update('done.jsonl', batch_id='batch_done', status='downloaded')
+        state.update('running.jsonl', file_id='file_running', batch_id='batch_running', status='submitted')
+        state.close()
+
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir=output_dir, resume=True)
+
+        async def chunks():
+            for name in ['done.jsonl', 'running.jsonl']:
+                yield name, io.BytesIO(b'{}\n')
+
+        batch_info = {'id': 'batch_running', 'status': 'completed', 'output_file_id': 'file_out'}
+        with patch.object(manager, 'upload_file', AsyncMock()) as mock_upload, \
+                patch.object(manager, 'wait_for_batch', AsyncMock(return_value=batch_info)) as mock_wait, \
+                patch.object(manager, 'download_batch_results', AsyncMock()):
+            await manager.process_batches(chunks())
+
+        mock_upload.assert_not_called()
+        mock_wait.assert_called_once_with('batch_running')
+        state = BatchState(os.path.join(output_dir, STATE_DB_NAME))
+        self.assertEqual(state.get('running.jsonl')['status'], 'downloaded')
+        state.close()
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_process_batches_records_poll_outcome(self, mock_client):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir=output_dir)
+
+        async def chunks():
+            for name in ['expired.jsonl', 'unreachable.jsonl']:
+                yield name, io.BytesIO(b'{}\n')
+
+        async def fake_wait_for_batch(batch_id):
+            if batch_id == 'batch_expired.jsonl':
+                raise BatchFailedError(batch_id, 'expired')
+            raise RuntimeError("Event loop is closed")
+
+        with patch.object(manager, 'upload_file', AsyncMock(side_effect=lambda name, payload: f"file_{name}")), \
+                patch.object(manager, 'create_batch', AsyncMock(side_effect=lambda file_id: file_id.replace('file_', 'batch_'))), \
+                patch.object(manager, 'wait_for_batch', side_effect=fake_wait_for_batch), \
+                patch.object(manager, 'download_batch_results', AsyncMock()) as mock_download:
+            await manager.process_batches(chunks())
+
+        mock_download.assert_not_called()
+        state = BatchState(os.path.join(output_dir, STATE_DB_NAME))
+        self.assertEqual(state.get('expired.jsonl')['status'], 'expired')
+        # The batch may still be running, so it must not be marked as failed
+        self.assertEqual(state.get('unreachable.jsonl')['status'], 'submitted')
+        state.close()
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_process_batches_resume_rejects_different_chunking(self, mock_client):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        input_file = os.path.join(output_dir, 'input.jsonl')
+        with open(input_file, 'w', encoding='utf-8') as f:
+            for i in range(10):
+                f.write(f'{{"id": {i}}}\n')
+
+        state = BatchState(os.path.join(output_dir, STATE_DB_NAME))
+        state.check_fingerprint(run_fingerprint(input_file, 5, 1000))
+        state.update('input.jsonl_chunk_1.jsonl', batch_id='batch_1', status='downloaded')
+        state.close()
+
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir=output_dir, resume=True)
+
+        async def chunks():
+            yield 'input.jsonl_chunk_1.jsonl', io.BytesIO(b'{}\n')
+
+        with patch.object(manager, 'upload_file', AsyncMock()) as mock_upload:
+            with self.assertRaises(ResumeStateMismatchError) as ctx:
+                await manager.process_batches(chunks(), fingerprint=run_fingerprint(input_file, 2, 1000))
+            # The same options resume without complaint
+            await manager.process_batches(chunks(), fingerprint=run_fingerprint(input_file, 5, 1000))
+
+        self.assertIn('chunk_size', str(ctx.exception))
+        mock_upload.assert_not_called()
+
+    def test_state_update_keeps_other_fields(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        state = BatchState(os.path.join(output_dir, STATE_DB_NAME))
+        self.addCleanup(state.close)
+        state.update('a.jsonl', file_id='file_a', status='uploaded')
+        state.update('a.jsonl', batch_id='batch_a', status='submitted')
+        state.update('b.jsonl')
+        self.assertEqual(state.get('a.jsonl'), {
+            'chunk_name': 'a.jsonl', 'file_id': 'file_a', 'batch_id': 'batch_a',
+            'status': 'submitted', 'output_file': None,
+        })
+        self.assertIsNotNone(state.get('b.jsonl'))
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_create_batch_retries_on_rate_limit(self, mock_client):
+        request = httpx.Request('POST', 'https://api.openai.com/v1/batches')
+        rate_limited = httpx.Response(429, headers={'retry-after': '0'}, request=request)
+        ok = httpx.Response(200, json={'id': 'batch_123'}, request=request)
+        mock_client.return_value.post = AsyncMock(side_effect=[rate_limited, ok])
+
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+
+        batch_id = await manager.create_batch('file_123')
+
+        self.assertEqual(batch_id, 'batch_123')
+        self.assertEqual(mock_client.return_value.post.call_count, 2)
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_create_batch_payload(self, mock_client):
+        mock_response = MagicMock()
+        mock_response.json.return_value = {'id': 'batch_123'}
+        mock_client.return_value.post = AsyncMock(return_value=mock_response)
+
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+
+        await manager.create_batch('file_123', metadata={'job': 'test'})
+
+        payload = json.loads(mock_client.return_value.post.call_args.kwargs['content'])
+        self.assertEqual(payload, {
+            'completion_window': '24h',
+            'endpoint': '/v1/completions',
+            'input_file_id': 'file_123',
+            'metadata': {'job': 'test'},
+        })
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    async def test_client_shared_between_managers(self, mock_client):
+        mock_client.side_effect = lambda **kwargs: MagicMock(aclose=AsyncMock())
+        first = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+        second = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+        larger = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.', max_concurrency=8)
+        client = first.client
+        self.assertIs(second.client, client)
+        self.assertIsNot(larger.client, client)  # A bigger pool isn't shared with smaller ones
+
+        await first.close()
+        client.aclose.assert_not_called()
+        await second.close()
+        client.aclose.assert_called_once()
+        await larger.close()
+
+    @patch('openai_batch_manager.batch_manager.httpx.AsyncClient')
+    def test_client_per_event_loop(self, mock_client):
+        mock_client.side_effect = lambda **kwargs: MagicMock(aclose=AsyncMock())
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+
+        async def use_client():
+            return manager.client
+
+        first = asyncio.run(use_client())
+        # A later run must not get the client bound to the first, now closed, loop
+        second = asyncio.run(use_client())
+        self.assertIsNot(first, second)
+
+    async def test_download_batch_results(self):
+        requested = []
+
+        def handler(request):
+            requested.append(request.url.path)
+            return httpx.Response(200, content=b'{"id": "req_1"}\n')
+
+        client = httpx.AsyncClient(base_url="https://api.openai.com", transport=httpx.MockTransport(handler))
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+        output_file = 'temp_results.jsonl'
+        self.addCleanup(os.remove, output_file)
+
+        with patch('openai_batch_manager.batch_manager._build_client', return_value=client):
+            await manager.download_batch_results({'id': 'batch_123', 'output_file_id': 'file_456'}, output_file)
+        await manager.close()
+
+        self.assertEqual(requested, ['/v1/files/file_456/content'])
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(), b'{"id": "req_1"}\n')
+
+    async def test_download_batch_results_without_output_file(self):
+        # Every request failed: the batch only has an error file
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        client = httpx.AsyncClient(
+            base_url="https://api.openai.com",
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, content=b'{"error": "bad"}\n')),
+        )
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir=output_dir)
+        batch_info = {'id': 'batch_123', 'status': 'completed', 'output_file_id': None, 'error_file_id': 'file_err'}
+        output_file = os.path.join(output_dir, 'results_batch_123.jsonl')
+
+        with patch('openai_batch_manager.batch_manager._build_client', return_value=client):
+            written = await manager.download_batch_results(batch_info, output_file)
+        await manager.close()
+
+        error_file = os.path.join(output_dir, 'errors_batch_123.jsonl')
+        self.assertEqual(written, [error_file])
+        self.assertFalse(os.path.exists(output_file))
+        with open(error_file, 'rb') as f:
+            self.assertEqual(f.read(), b'{"error": "bad"}\n')
+
+    @patch('openai_batch_manager.batch_manager.random.uniform', return_value=1.2)
+    @patch('openai_batch_manager.batch_manager.asyncio.sleep', new_callable=AsyncMock)
+    async def test_wait_for_batch_backoff(self, mock_sleep, mock_uniform):
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+        statuses = ['validating', 'in_progress', 'in_progress', 'in_progress', 'completed']
+        responses = [{'id': 'batch_123', 'status': status} for status in statuses]
+
+        with patch.object(manager, 'get_batch_status', AsyncMock(side_effect=responses)):
+            batch_info = await manager.wait_for_batch('batch_123')
+
+        self.assertEqual(batch_info['status'], 'completed')
+        # 5 s to start, reset on each status change, x1.5 while unchanged, +20% jitter
+        delays = [call.args[0] for call in mock_sleep.call_args_list]
+        for actual, expected in zip(delays, [5.0 * 1.2, 5.0 * 1.2, 7.5 * 1.2, 11.25 * 1.2]):
+            self.assertAlmostEqual(actual, expected)
+        self.assertEqual(len(delays), 4)
+        mock_uniform.assert_called_with(0.8, 1.2)
+
+    @patch('openai_batch_manager.batch_manager.random.uniform', return_value=0.8)
+    @patch('openai_batch_manager.batch_manager.asyncio.sleep', new_callable=AsyncMock)
+    async def test_wait_for_batch_backoff_is_capped(self, mock_sleep, mock_uniform):
+        manager = BatchManager(api_key='test_key', endpoint='/v1/completions', completion_window='24h', output_dir='.')
+        statuses = ['in_progress'] * 12 + ['completed']
+        responses = [{'id': 'batch_123', 'status': status} for status in statuses]
+
+        with patch.object(manager, 'get_batch_status', AsyncMock(side_effect=responses)):
+            await manager.wait_for_batch('batch_123')
+
+        delays = [call.args[0] / 0.8 for call in mock_sleep.call_args_list]
+        self.assertAlmostEqual(max(delays), 120.0)
+        self.assertAlmostEqual(delays[-1], 120.0)
+
+    def test_wait_retry_after_is_capped(self):
+        request = httpx.Request('POST', 'https://api.openai.com/v1/batches')
+        wait = _wait_retry_after(wait_exponential(multiplier=1, min=4, max=10))
+
+        def retry_state_for(headers):
+            response = httpx.Response(429, headers=headers, request=request)
+            exc = httpx.HTTPStatusError('rate limited', request=request, response=response)
+            retry_state = MagicMock()
+            retry_state.outcome.exception.return_value = exc
+            return retry_state
+
+        self.assertEqual(wait(retry_state_for({'retry-after': '3'})), 3.0)
+        self.assertEqual(wait(retry_state_for({'retry-after': '86400'})), RETRY_AFTER_MAX)
+
+    def test_is_retryable(self):
+        request = httpx.Request('GET', 'https://api.openai.com/v1/batches/b')
+        self.assertTrue(_is_retryable(httpx.ConnectError('down', request=request)))
+        for code, expected in [(429, True), (503, True), (400, False), (404, False)]:
+            response = httpx.Response(code, request=request)
+            exc = httpx.HTTPStatusError('error', request=request, response=response)
+            self.assertEqual(_is_retryable(exc), expected)
+        self.assertFalse(_is_retryable(ValueError('nope')))
+
     # Add more tests for other methods
 
 if __name__ == '__main__':
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 import os
 import json
 from openai_batch_manager.jsonl_helper import csv_to_jsonl, validate_jsonl, create_jsonl_manual
@@ -28,6 +29,30 @@ class TestJSONLHelper(unittest.TestCase):
             self.assertEqual(json.loads(lines[0]), {"name": "Alice", "age": "30"})
             self.assertEqual(json.loads(lines[1]), {"name": "Bob", "age": "25"})
 
+    def _check_csv_to_jsonl_bom_leading_zeros(self):
+        with open(self.csv_file, 'w', encoding='utf-8-sig') as f:
+            f.write('id,name\n')
+            f.write('007,Alice\n')
+        csv_to_jsonl(self.csv_file, self.jsonl_file)
+        with open(self.jsonl_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.loads(f.readline()), {"id": "007", "name": "Alice"})
+
+    def test_csv_to_jsonl_bom_leading_zeros(self):
+        self._check_csv_to_jsonl_bom_leading_zeros()
+
+    @patch('openai_batch_manager.jsonl_helper.pacsv', None)
+    def test_csv_to_jsonl_bom_leading_zeros_without_pyarrow(self):
+        self._check_csv_to_jsonl_bom_leading_zeros()
+
+    @patch('openai_batch_manager.jsonl_helper.pacsv', None)
+    def test_csv_to_jsonl_without_pyarrow(self):
+        csv_to_jsonl(self.csv_file, self.jsonl_file)
+        with open(self.jsonl_file, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(json.loads(lines[0]), {"name": "Alice", "age": "30"})
+            self.assertEqual(json.loads(lines[1]), {"name": "Bob", "age": "25"})
+
     def test_validate_jsonl_valid(self):
         csv_to_jsonl(self.csv_file, self.jsonl_file)
         self.assertTrue(validate_jsonl(self.jsonl_file))
@@ -39,6 +64,19 @@ class TestJSONLHelper(unittest.TestCase):
             f.write('Invalid JSON Line\n')
         self.assertFalse(validate_jsonl(self.jsonl_file))
 
+    @patch('openai_batch_manager.jsonl_helper.PARALLEL_VALIDATE_MIN_BYTES', 0)
+    def test_validate_jsonl_parallel(self):
+        with open(self.jsonl_file, 'w', encoding='utf-8') as f:
+            for i in range(100):
+                f.write(f'{{"id": {i}}}\n')
+        self.assertTrue(validate_jsonl(self.jsonl_file, workers=4))
+
+        with open(self.jsonl_file, 'a', encoding='utf-8') as f:
+            f.write('Invalid JSON Line\n')
+        with self.assertLogs('JSONLHelper', level='ERROR') as logs:
+            self.assertFalse(validate_jsonl(self.jsonl_file, workers=4))
+        self.assertIn('line 101', logs.output[0])
+
     def test_create_jsonl_manual(self):
         records = [{"name": "Charlie", "age": "22"}, {"name": "Dana", "age": "28"}]
         create_jsonl_manual(self.jsonl_file, records)
@@ -48,5 +86,13 @@ class TestJSONLHelper(unittest.TestCase):
             self.assertEqual(json.loads(lines[0]), {"name": "Charlie", "age": "22"})
             self.assertEqual(json.loads(lines[1]), {"name": "Dana", "age": "28"})
 
+    @patch('openai_batch_manager.jsonl_helper.orjson', None)
+    def test_create_jsonl_manual_without_orjson(self):
+        records = [{"name": "Charlie", "age": "22"}]
+        create_jsonl_manual(self.jsonl_file, records)
+        self.assertTrue(validate_jsonl(self.jsonl_file))
+        with open(self.jsonl_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.loads(f.read()), {"name": "Charlie", "age": "22"})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+import os
+from openai_batch_manager.utils import DirectFileWriter, iter_chunks, split_jsonl_file
+
+class TestUtils(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.jsonl_file = 'temp_test_utils.jsonl'
+        with open(self.jsonl_file, 'w', encoding='utf-8') as f:
+            for i in range(5):
+                f.write(f'{{"id": {i}}}\n')
+
+    def tearDown(self):
+        for file in [self.jsonl_file] + [f"{self.jsonl_file}_chunk_{i}.jsonl" for i in range(1, 4)]:
+            if os.path.exists(file):
+                os.remove(file)
+
+    def test_split_jsonl_file(self):
+        chunk_files = split_jsonl_file(self.jsonl_file, 2)
+        self.assertEqual(len(chunk_files), 3)
+        with open(chunk_files[0], 'rb') as f:
+            self.assertEqual(f.read(), b'{"id": 0}\n{"id": 1}\n')
+        with open(chunk_files[2], 'rb') as f:
+            self.assertEqual(f.read(), b'{"id": 4}\n')
+
+    async def test_iter_chunks(self):
+        chunks = [(name, payload.read()) async for name, payload in iter_chunks(self.jsonl_file, 2)]
+        self.assertEqual([name for name, _ in chunks], [
+            'temp_test_utils.jsonl_chunk_1.jsonl',
+            'temp_test_utils.jsonl_chunk_2.jsonl',
+            'temp_test_utils.jsonl_chunk_3.jsonl',
+        ])
+        self.assertEqual(chunks[0][1], b'{"id": 0}\n{"id": 1}\n')
+        self.assertEqual(chunks[2][1], b'{"id": 4}\n')
+
+    async def test_iter_chunks_without_trailing_newline(self):
+        with open(self.jsonl_file, 'wb') as f:
+            f.write(b'{"id": 0}\n{"id": 1}\n{"id": 2}')
+        chunks = [payload.read() async for _, payload in iter_chunks(self.jsonl_file, 2)]
+        self.assertEqual(chunks, [b'{"id": 0}\n{"id": 1}\n', b'{"id": 2}'])
+
+    async def test_iter_chunks_max_bytes(self):
+        # Each line is 10 bytes, so a 25-byte cap fits two lines per chunk
+        chunks = [payload.read() async for _, payload in iter_chunks(self.jsonl_file, 1000, max_bytes=25)]
+        self.assertEqual(chunks, [
+            b'{"id": 0}\n{"id": 1}\n',
+            b'{"id": 2}\n{"id": 3}\n',
+            b'{"id": 4}\n',
+        ])
+
+    async def test_iter_chunks_line_larger_than_max_bytes(self):
+        chunks = [payload.read() async for _, payload in iter_chunks(self.jsonl_file, 1000, max_bytes=5)]
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(chunks[0], b'{"id": 0}\n')
+
+    async def test_chunk_limits_must_be_positive(self):
+        for chunk_size, max_bytes in [(0, 100), (-1, 100), (2, 0)]:
+            with self.assertRaises(ValueError):
+                split_jsonl_file(self.jsonl_file, chunk_size, max_bytes)
+            with self.assertRaises(ValueError):
+                [chunk async for chunk in iter_chunks(self.jsonl_file, chunk_size, max_bytes)]
+
+    async def test_iter_chunks_empty_file(self):
+        open(self.jsonl_file, 'wb').close()
+        chunks = [chunk async for chunk in iter_chunks(self.jsonl_file, 2)]
+        self.assertEqual(chunks, [])
+
+    def _check_direct_file_writer(self):
+        data = os.urandom(3 * 8192 + 123)
+        with DirectFileWriter(self.jsonl_file, buffer_size=8192) as writer:
+            for start in range(0, len(data), 5000):
+                writer.write(data[start:start + 5000])
+        with open(self.jsonl_file, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_direct_file_writer(self):
+        self._check_direct_file_writer()
+
+    def test_direct_file_writer_buffered_fallback(self):
+        with patch.object(DirectFileWriter, '_direct_supported', return_value=False):
+            self._check_direct_file_writer()
+
+    def test_direct_file_writer_open_failure(self):
+        missing = os.path.join('no_such_dir', 'out.jsonl')
+        with patch('openai_batch_manager.utils.mmap.mmap') as mock_mmap:
+            with self.assertRaises(FileNotFoundError):
+                DirectFileWriter(missing)
+        mock_mmap.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()